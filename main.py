@@ -3,45 +3,55 @@
 import os
 import sys, select
 import argparse
-import yaml
-import timeit
-import subprocess
 from pathlib import Path
-from src.xai_chat import XaiChat
-from src.gemini_chat import GeminiChat
-from src.base_chat import BaseChatClient
-from src.openai_chat import OpenAiChat
-from src.openai_compatible_chat import OpenAiCompatibleChat
 from src.llmclient import LLMClient, RoleConfig
 from src.config_manager import ConfigManager
-from src.command_handler import CommandHandler
+from src.command_handler import CommandHandler, console
 from typing import Dict, Any, List
-from rich.console import Console
 from rich.text import Text
 import logging
 
 TIMING = False
 MARKDOWN = True
 
+# LLM_CLI_LOG=DEBUG (or any level name) shows that level on the console
+_log_level_name = os.environ.get('LLM_CLI_LOG', '').upper()
+# getLevelName maps known names to their number and anything else to a string
+_log_level = logging.getLevelName(_log_level_name) if _log_level_name else None
+if not isinstance(_log_level, int):
+    _log_level = None
 logger = logging.getLogger('llmchat')
+logger.setLevel(_log_level or logging.INFO)
 console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.ERROR)
+console_handler.setLevel(_log_level or logging.ERROR)
 formatter = logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
 )
 console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
+if _log_level_name and _log_level is None:
+    # ERROR so the default console handler actually shows it
+    logger.error("Unknown LLM_CLI_LOG level %r; using the default levels", _log_level_name)
 
 
-import builtins
 import traceback
-old_open = builtins.open
-def logged_open(filename, mode='r', *args, **kwargs):
-    if any(c in mode for c in 'wax+'):
-        logger.warning(f"Opening {filename} in mode {mode}")
+def log_write_opens(event, args):
+    """Audit hook that logs every file opened for writing, with the caller's stack."""
+    if event != 'open':
+        return
+    filename, mode, flags = args
+    if mode is None:
+        # os.open (e.g. tempfile) passes no mode, only the O_* flags
+        writing = bool(flags & (os.O_WRONLY | os.O_RDWR | os.O_CREAT))
+    else:
+        writing = any(c in mode for c in 'wax+')
+    if writing:
+        logger.warning("Opening %s in mode %s (flags %#o)", filename, mode, flags)
         logger.warning("Stack:\n" + ''.join(traceback.format_stack()))
-    return old_open(filename, mode, *args, **kwargs)
-builtins.open = logged_open
+
+# Debug aid only: walking the stack on every write is too costly to leave on
+if os.environ.get('LLMCHAT_TRACE_OPENS'):
+    sys.addaudithook(log_write_opens)
 
 
 if __name__ == "__main__":
@@ -54,7 +64,6 @@ if __name__ == "__main__":
     
     try:
         config_manager = ConfigManager(Path.home() / ".config" / "llm-chat-cli" / "configs.yaml")
-        console = Console(record=True)
         llm_client = LLMClient(config_manager, roles_path=Path.home() / ".config" / "llm-chat-cli" / "roles.yaml")
         command_handler = CommandHandler(config_manager, llm_client)
         code_role = RoleConfig(
@@ -68,18 +77,21 @@ if __name__ == "__main__":
         llm_client.load_model()
         logger.debug("loaded default model")
     except Exception as e:
-        logger.error(f"Error loading configuration: {e}")
+        logger.error("Error loading configuration: %s", e)
         exit(1)
         
-    if args.c:
-        user_input=' '.join(args.c)
-        command_handler.handle_input(user_input)
-    else:
-        st = True
-        while st:
-            prompt = Text("\n> ", style="white on @2f2430 bold")
-            try:
-                user_input = console.input(prompt)
-                st = command_handler.handle_input(user_input)
-            except Exception as e:
-                logger.error(e)
+    try:
+        if args.c:
+            user_input=' '.join(args.c)
+            command_handler.handle_input(user_input)
+        else:
+            st = True
+            while st:
+                prompt = Text("\n> ", style="white on @2f2430 bold")
+                try:
+                    user_input = console.input(prompt)
+                    st = command_handler.handle_input(user_input)
+                except Exception as e:
+                    logger.error(e)
+    finally:
+        llm_client.close()
@@ -1,38 +1,165 @@
 # base_chat.py
+import logging
+import random
+import re
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import requests
+from . import http_pool
+from .json_compat import dumps, loads
+
+logger = logging.getLogger('llmchat.base_chat')
+
+# Statuses worth retrying: rate limiting and transient server errors
+_RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+# The text delta of an OpenAI-style stream event, still JSON-escaped
+_SSE_CONTENT_RE = re.compile(rb'"content"\s*:\s*"((?:[^"\\]|\\.)*)"')
+# Error bodies (e.g. a proxy's HTML page) are cut to this many bytes in messages
+_ERROR_BODY_LIMIT = 2048
+# Circuit breaker state per server (api_base), shared by every client of that server
+_BREAKERS: Dict[str, Dict[str, float]] = {}
 
 class BaseChatClient(ABC):
+    max_retries = 3
+    retry_base_delay = 0.25      # seconds, doubled on each attempt
+    breaker_threshold = 5        # failures within breaker_window that open the circuit
+    breaker_window = 30.0        # seconds
+    breaker_cooldown = 10.0      # seconds the circuit stays open
+    # Pulls the text out of a stream event without decoding the whole event; None disables it
+    _stream_text_re = _SSE_CONTENT_RE
+
     def __init__(self, config: Dict[str, Any], model_config: Dict[str, Any]):
         self.api_base = config['api_base']
         self.api_key = config.get('api_key', '')
         self.model_name = model_config['name']
-        self.timeout = 300  # Default timeout in seconds
+        # (connect, read) seconds: an unreachable host fails fast, a slow generation doesn't
+        self.timeout = (3.05, 300)
+        # Shared keep-alive pool: follow-up turns and model switches reuse the TCP/TLS connection
+        self._session = http_pool.SESSION
+        self._breaker = _BREAKERS.setdefault(
+            self.api_base, {'fails': 0, 'first_fail': 0.0, 'open_until': 0.0})
+
+    def close(self) -> None:
+        """Nothing to release per client: connections belong to the shared http_pool."""
+
+    def _check_breaker(self) -> None:
+        """Fail fast while the circuit is open; once it expires the next request goes through."""
+        remaining = self._breaker['open_until'] - time.monotonic()
+        if remaining > 0:
+            raise RuntimeError(
+                f"{self.__class__.__name__} server {self.api_base} is failing repeatedly; "
+                f"not retrying for another {remaining:.0f}s"
+            )
+
+    def _record_failure(self) -> None:
+        now = time.monotonic()
+        breaker = self._breaker
+        if now - breaker['first_fail'] > self.breaker_window:
+            breaker['fails'], breaker['first_fail'] = 0, now
+        breaker['fails'] += 1
+        if breaker['fails'] >= self.breaker_threshold:
+            breaker['open_until'] = now + self.breaker_cooldown
+
+    def _record_success(self) -> None:
+        self._breaker['fails'] = 0
+        self._breaker['open_until'] = 0.0
+
+    def _post_with_retry(self, url: str, headers: Dict[str, str], data: bytes,
+                         stream: bool = False) -> requests.Response:
+        """POST with exponential backoff on connection errors, 429 and 5xx responses.
+
+        Read timeouts are not retried: by then the full timeout has already elapsed.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._check_breaker()
+            try:
+                response = self._session.post(url, headers=headers, data=data,
+                                              timeout=self.timeout, stream=stream)
+            except requests.exceptions.ConnectionError:
+                self._record_failure()
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in _RETRY_STATUS:
+                    self._record_success()
+                    return response
+                self._record_failure()
+                if attempt == self.max_retries:
+                    return response
+                response.close()
+            time.sleep(self.retry_base_delay * 2 ** attempt + random.random() * self.retry_base_delay)
 
     def _send_request(self, url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send an HTTP POST request and decode the JSON reply."""
+        return self._decode(self._post(url, headers, payload).content)
+
+    def _post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+              stream: bool = False) -> requests.Response:
         """Send an HTTP POST request and handle common exceptions."""
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=self.timeout)
+            response = self._post_with_retry(url, headers, dumps(payload), stream=stream)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as http_err:
-            raise RuntimeError(
-                f"HTTP error from {self.__class__.__name__} (model: {self.model_name}): "
-                f"{http_err.response.status_code} - {http_err.response.text}"
-            ) from http_err
-        except requests.exceptions.ConnectionError as conn_err:
+        except requests.exceptions.RequestException as err:
+            # Keep the chained traceback only when someone is debugging
+            cause = err if logger.isEnabledFor(logging.DEBUG) else None
+            raise RuntimeError(self._describe_error(err)) from cause
+        return response
+
+    def _describe_error(self, err: requests.exceptions.RequestException) -> str:
+        name = self.__class__.__name__
+        if isinstance(err, requests.exceptions.HTTPError):
+            body = next(err.response.iter_content(_ERROR_BODY_LIMIT), b'')
+            err.response.close()
+            return (f"HTTP error from {name} (model: {self.model_name}): "
+                    f"{err.response.status_code} - {body.decode('utf-8', errors='replace')}")
+        # ConnectTimeout is both a ConnectionError and a Timeout; report it as a timeout
+        if isinstance(err, requests.exceptions.ConnectTimeout):
+            return f"Timed out connecting to {name} server {self.api_base} after {self.timeout[0]}s"
+        if isinstance(err, requests.exceptions.ConnectionError):
+            return f"Failed to connect to {name} server: {self.api_base}"
+        if isinstance(err, requests.exceptions.Timeout):
+            return f"Request to {name} server timed out after {self.timeout[1]}s"
+        return f"Unexpected error during {name} request: {err}"
+
+    async def _send_request_async(self, client, url: str, headers: Dict[str, str],
+                                  payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Async counterpart of _send_request on a shared httpx.AsyncClient."""
+        import httpx
+
+        try:
+            async with client.stream('POST', url, headers=headers, content=dumps(payload)) as response:
+                if response.is_error:
+                    body = b''
+                    async for body in response.aiter_bytes(_ERROR_BODY_LIMIT):
+                        break
+                    raise RuntimeError(
+                        f"HTTP error from {self.__class__.__name__} (model: {self.model_name}): "
+                        f"{response.status_code} - {body.decode('utf-8', errors='replace')}"
+                    )
+                body = await response.aread()
+        except httpx.ConnectError as conn_err:
             raise RuntimeError(
                 f"Failed to connect to {self.__class__.__name__} server: {self.api_base}"
             ) from conn_err
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             raise RuntimeError(
-                f"Request to {self.__class__.__name__} server timed out after {self.timeout}s"
+                f"Request to {self.__class__.__name__} server timed out after {self.timeout[1]}s"
             ) from None
-        except requests.exceptions.RequestException as req_err:
+        except httpx.HTTPError as req_err:
             raise RuntimeError(
                 f"Unexpected error during {self.__class__.__name__} request: {req_err}"
             ) from req_err
+        return self._decode(body)
+
+    def _decode(self, body: bytes) -> Dict[str, Any]:
+        """Decode a JSON response body."""
+        try:
+            return loads(body)
+        except ValueError as decode_err:
+            raise RuntimeError(
+                f"Invalid JSON response from {self.__class__.__name__} (model: {self.model_name}): {decode_err}"
+            ) from decode_err
 
     def _parse_response(self, data: Dict[str, Any]) -> str:
         """Parse JSON response and handle common parsing errors."""
@@ -44,6 +171,59 @@ class BaseChatClient(ABC):
                 f"Invalid response format from {self.__class__.__name__} (model: {self.model_name}): {parse_err}"
             ) from parse_err
 
+    def _parse_stream_chunk(self, chunk: Dict[str, Any]) -> Optional[str]:
+        """Extract the text delta from one streamed event, if it carries any."""
+        # Subclasses must override this if the stream event structure differs
+        choices = chunk.get('choices')
+        if not choices:
+            return None
+        return choices[0].get('delta', {}).get('content')
+
+    def _extract_stream_text(self, data: bytes) -> Optional[str]:
+        """Return the text carried by one raw stream event."""
+        if self._stream_text_re is not None:
+            match = self._stream_text_re.search(data)
+            if match:
+                # Decode just the escaped string instead of the whole event
+                return loads(b'"' + match.group(1) + b'"')
+        return self._parse_stream_chunk(self._decode(data))
+
+    def _build_stream_request(self, messages: List[Dict[str, str]],
+                              temperature: float) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Return the (url, headers, payload) for a streamed (SSE) chat completion call."""
+        url, headers, payload = self._build_request(messages, temperature)
+        return url, headers, {**payload, 'stream': True}
+
     @abstractmethod
-    def send_message(self, messages: List[Dict[str, str]], temperature: float) -> str:
+    def _build_request(self, messages: List[Dict[str, str]],
+                       temperature: float) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Return the (url, headers, payload) for a chat completion call."""
         pass
+
+    def send_message(self, messages: List[Dict[str, str]], temperature: float) -> str:
+        url, headers, payload = self._build_request(messages, temperature)
+        return self._parse_response(self._send_request(url, headers, payload))
+
+    def send_message_stream(self, messages: List[Dict[str, str]], temperature: float) -> Iterator[str]:
+        """Yield the reply text as the server streams it."""
+        url, headers, payload = self._build_stream_request(messages, temperature)
+        response = self._post(url, headers, payload, stream=True)
+        with response:
+            try:
+                for line in response.iter_lines():
+                    if not line.startswith(b'data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == b'[DONE]':
+                        break
+                    text = self._extract_stream_text(data)
+                    if text:
+                        yield text
+            except requests.exceptions.RequestException as req_err:
+                raise RuntimeError(
+                    f"Stream from {self.__class__.__name__} (model: {self.model_name}) interrupted: {req_err}"
+                ) from req_err
+
+    async def send_message_async(self, messages: List[Dict[str, str]], temperature: float, client) -> str:
+        url, headers, payload = self._build_request(messages, temperature)
+        return self._parse_response(await self._send_request_async(client, url, headers, payload))
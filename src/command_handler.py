@@ -2,13 +2,15 @@ import os
 from src.llmclient import LLMClient
 from src.config_manager import ConfigManager
 import logging
-import timeit
+from time import perf_counter_ns
 from rich.console import Console
-from rich.markdown import Markdown
 from rich.text import Text
-import questionary
+from rich.live import Live
 import pyperclip
 
+# Shared by the whole process so Rich's render caches are reused
+console = Console()
+
 
 
 
@@ -20,21 +22,28 @@ class CommandHandler:
             ':help': (self._help, "Print help"),
             ':clear': (self._clear, "Clear the screen"),
             ':models': (self._models, "List and select a model"),
-            ':updateollama': (self._update_ollama_models, "Update config file with pulled ollama models"),
+            ':updateollama': (self._update_ollama_models, "Update config file with pulled ollama models (:updateollama all for every client)"),
             ':set': (self._set, "Set some features on or off"),
             ':role': (self._role, "Change the role of the assistant"),
             ':listroles': (self._list_roles, "List the existing roles"),
-            ':copy': (self._copy, "Copy the latest response to the clipboard")
+            ':copy': (self._copy, "Copy the latest response to the clipboard"),
+            ':compare': (self._compare, "Ask several models at once: :compare <model>,<model> <question>"),
+            ':batch': (self._batch, "Answer every line of a file in a single request: :batch <file>"),
+            ':parallel': (self._parallel, "Answer every line of a file with concurrent requests: :parallel <file>")
         }
+        # Split once so dispatch doesn't unpack (fn, help) tuples
+        self._actions = {name: fn for name, (fn, _) in self.commands.items()}
+        self._helps = {name: help_text for name, (_, help_text) in self.commands.items()}
         self.args = []
         self.config_manager = config_manager
         self.llm_client = llm_client
         self.logger = logging.getLogger('llmchat.configmanager')
         self.set_config = {
             'timing': True,
-            'markdown': True
+            'markdown': True,
+            'stream': True
         }
-        self.console = Console()
+        self.console = console
 
     def _exit(self):
         print("Bye!")
@@ -42,36 +51,27 @@ class CommandHandler:
 
     def _help(self):
         print("\n")
-        for command, value in self.commands.items():
-            print(f"{command} -> {value[1]}")
+        for command, help_text in self._helps.items():
+            print(f"{command} -> {help_text}")
         return True
 
     def _clear(self):
-        os.system('cls' if os.name == 'nt' else 'clear')
+        # Rich emits the clear-screen control itself, including on legacy Windows consoles
+        self.console.clear()
         return True
 
     def _models(self):
-        models = self.llm_client.list_models()
-        # Create display choices with type information
         choices = []
-        for model in models:
-            parts = model.split(':')
-            if len(parts) < 2:
-                self.logger.error(f"Invalid model format: {model}")
+        for model in self.llm_client.list_models():
+            if ':' not in model:
+                self.logger.error("Invalid model format: %s", model)
                 continue
-            client_name = parts[0]
-            model_name = ':'.join(parts[1:])  # Join all parts after client_name
-            client_config = next(
-                (client for client in self.config_manager.get_config().get('clients', []) if client.get('name') == client_name),
-                None
-            )
-            client_type = client_config.get('type', 'unknown') if client_config else 'unknown'
-            choices.append(f"{model}")
+            choices.append(model)
         default = self.llm_client.get_current_model()
         if default not in choices:
             default = None
-        print(default)
-        print(choices)
+        import questionary
+
         try:
             selected_model = questionary.select(
                 "Select a model:",
@@ -89,23 +89,32 @@ class CommandHandler:
 
     def _set(self):
         if not self.args:
-            print("set options: timing, notiming, markdown, nomarkdown")
+            print("set options: timing, notiming, markdown, nomarkdown, stream, nostream")
             return True
         self.set_config['timing'] = (self.set_config['timing'] and not (self.args[0] == "notiming")
                  or self.args[0] == "timing")
 
         self.set_config['markdown'] = (self.set_config['markdown'] and not (self.args[0] == "nomarkdown")
                  or self.args[0] == "markdown")
+
+        self.set_config['stream'] = (self.set_config['stream'] and not (self.args[0] == "nostream")
+                 or self.args[0] == "stream")
         return True
 
     def _update_ollama_models(self):
-        self.config_manager.update_ollama_models()
+        if self.args and self.args[0] == 'all':
+            self.config_manager.update_all_ollama_models()
+        else:
+            self.config_manager.update_ollama_models()
+        self.llm_client.invalidate_models()
         return True
 
     def _list_roles(self):
         if not self.llm_client.roles:
             print("No roles available.")
             return True
+        import questionary
+
         choices = [f"{name}: {role.description or 'No description'}" for name, role in self.llm_client.roles.items()]
         selected_role = questionary.select(
             "Select a role:",
@@ -132,54 +141,156 @@ class CommandHandler:
         print(f"Role set to {selected_role}")
         return True
 
+    def _compare(self):
+        if len(self.args) < 2:
+            print("usage: :compare <model>,<model>[,...] <question>")
+            return True
+        from rich.markdown import Markdown
+
+        models = self.args[0].split(',')
+        user_input = ' '.join(self.args[1:])
+        start = perf_counter_ns()
+        results = self.llm_client.send_to_models(user_input, models)
+        end = perf_counter_ns()
+        for model, result in zip(models, results):
+            self.console.rule(model)
+            if isinstance(result, Exception):
+                self.console.print(f"[red]LLM server error: {result}[/red]")
+            elif self.set_config['markdown']:
+                self.console.print(Markdown(result))
+            else:
+                self.console.print(result)
+        if self.set_config['timing']:
+            print(f"\n{(end - start) / 1e9:.2f} sec.")
+        return True
+
+    def _batch(self):
+        if not self.args:
+            print("usage: :batch <file with one prompt per line>")
+            return True
+        from rich.markdown import Markdown
+
+        with open(os.path.expanduser(self.args[0]), 'r') as f:
+            inputs = [line.strip() for line in f if line.strip()]
+        if not inputs:
+            print("No prompts found in", self.args[0])
+            return True
+        start = perf_counter_ns()
+        answers = self.llm_client.send_batch(inputs)
+        end = perf_counter_ns()
+        for i, (prompt, answer) in enumerate(zip(inputs, answers), 1):
+            self.console.rule(f"{i}) {prompt}")
+            self.console.print(Markdown(answer) if self.set_config['markdown'] else answer)
+        if self.set_config['timing']:
+            print(f"\n{(end - start) / 1e9:.2f} sec.")
+        return True
+
+    def _parallel(self):
+        if not self.args:
+            print("usage: :parallel <file with one prompt per line>")
+            return True
+        from rich.markdown import Markdown
+
+        with open(os.path.expanduser(self.args[0]), 'r') as f:
+            inputs = [line.strip() for line in f if line.strip()]
+        if not inputs:
+            print("No prompts found in", self.args[0])
+            return True
+        role = self.llm_client.active_role
+        messages_list = [self.llm_client.build_messages_for_role(prompt, role=role, history=[])
+                         for prompt in inputs]
+        start = perf_counter_ns()
+        results = self.llm_client.send_many(messages_list)
+        end = perf_counter_ns()
+        for i, (prompt, result) in enumerate(zip(inputs, results), 1):
+            self.console.rule(f"{i}) {prompt}")
+            if isinstance(result, Exception):
+                self.console.print(f"[red]LLM server error: {result}[/red]")
+            else:
+                self.console.print(Markdown(result) if self.set_config['markdown'] else result)
+        if self.set_config['timing']:
+            print(f"\n{(end - start) / 1e9:.2f} sec.")
+        return True
+
     def _unknown_command(self):
         print("Unknown command. Try one of these:")
-        print(*self.commands)
+        print(*self._actions)
         return True
 
     def handle_input(self, user_input):
-        if not len(user_input):
+        # Chat prompts are the common case: don't tokenize them looking for a command
+        stripped = user_input.lstrip()
+        if not stripped.startswith(':'):
+            return self._chat(user_input) if stripped else True
+        command, *rest = stripped.rstrip().split(maxsplit=1)
+        command = command.lower()
+        self.args = rest[0].split() if rest else []
+        action = self._actions.get(command)
+        if action is None:
+            return self._unknown_command()
+        try:
+            return action()
+        except Exception as e:
+            self.logger.error(e)
+            print("Error executing action:", command)
             return True
-        command, *self.args = user_input.strip().split(maxsplit=1)
-        self.args = self.args[0].split() if self.args else []
-        if command.startswith(":"):
-            try:
-                action, _ = self.commands.get(command, self._unknown_command)
-            except:
-                self._unknown_command()
+
+    def _chat(self, user_input):
+        try:
+            if self.set_config['stream']:
+                self._stream_response(user_input)
                 return True
-            try:
-                return action()
-            except Exception as e:
-                self.logger.error(e)
-                print("Error executing action:", command)
-        else:
-            try:
-                message = self.llm_client.build_messages_for_role(user_input)
-                start = timeit.default_timer()
-                response = self.llm_client.send_with_role(user_input)
-                end = timeit.default_timer()
-                
-                if self.set_config['timing']:
-                    response += f"\n\n{end - start:.2f} sec."
-                
-                if self.set_config['markdown']:
-                    md = Markdown(response)
-                else:
-                    md = response
+            start = perf_counter_ns()
+            response = self.llm_client.send_with_role(user_input)
+            end = perf_counter_ns()
+            
+            if self.set_config['timing']:
+                response += f"\n\n{(end - start) / 1e9:.2f} sec."
+            
+            if self.set_config['markdown']:
+                from rich.markdown import Markdown
+                md = Markdown(response)
+            else:
+                md = response
+            # Short replies fit on screen; only long ones go through the pager
+            if response.count('\n') + 1 < self.console.size.height - 2:
+                self.console.print(md)
+            else:
                 with self.console.pager(styles=True, links=True):
                     self.console.print(md)
-            except ValueError as ve:
-                self.console.print(f"[red]Configuration error: {ve}[/red]")
-                self.logger.debug(f"ValueError: {ve}")
-            except RuntimeError as re:
-                self.console.print(f"[red]LLM server error: {re}[/red]")
-                self.logger.debug(f"RuntimeError: {re}")
-            except Exception as e:
-                self.console.print(f"[red]Unexpected error: {e}[/red]")
-                self.logger.error(f"Unexpected error: {e}")      
-            return True
+        except ValueError as ve:
+            self.console.print(f"[red]Configuration error: {ve}[/red]")
+            self.logger.debug("ValueError: %s", ve)
+        except RuntimeError as re:
+            self.console.print(f"[red]LLM server error: {re}[/red]")
+            self.logger.debug("RuntimeError: %s", re)
+        except Exception as e:
+            self.console.print(f"[red]Unexpected error: {e}[/red]")
+            self.logger.error("Unexpected error: %s", e)      
+        return True
+
 
+    def _stream_response(self, user_input):
+        """Render the reply while it streams, re-parsing the Markdown at most 10 times a second."""
+        if self.set_config['markdown']:
+            from rich.markdown import Markdown as render
+        else:
+            render = Text
+        response = ''
+        start = perf_counter_ns()
+        last_update = start
+        with Live(render(''), console=self.console, refresh_per_second=10,
+                  vertical_overflow='visible') as live:
+            for chunk in self.llm_client.send_with_role_stream(user_input):
+                response += chunk
+                now = perf_counter_ns()
+                if now - last_update >= 100_000_000:  # 0.1 s
+                    live.update(render(response))
+                    last_update = now
+            live.update(render(response))
+        end = perf_counter_ns()
+        if self.set_config['timing']:
+            self.console.print(f"\n{(end - start) / 1e9:.2f} sec.", highlight=False, markup=False)
 
     def _copy(self):
         history = self.llm_client.get_history()
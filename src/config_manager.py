@@ -1,58 +1,115 @@
-import yaml
+import atexit
+import contextlib
+import copy
+import os
+import stat
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from pathlib import Path
-from typing import Dict, Any
-import subprocess
+from typing import Dict, Any, List, Optional
 import logging
+from . import http_pool, yaml_cache
+from .json_compat import loads
 
 class ConfigManager:
     """Manages loading, updating, and saving configuration from a YAML file."""
 
+    save_delay = 0.1  # seconds; updates within this window are written once
+
     def __init__(self, config_path: str):
         self.config_path = Path(config_path)
         self.config = self._load_config()
         self.logger = logging.getLogger("llmchat.config_manager")
+        # Snapshot waiting to be written; None when the file is up to date
+        self._pending: Optional[Dict[str, Any]] = None
+        self._flush_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        # Pending changes still reach the file if the program exits first
+        atexit.register(self._background_flush)
 
     def _load_config(self) -> Dict[str, Any]:
         """Load the configuration from the YAML file."""
         try:
-            with self.config_path.open('r') as f:
-                return yaml.safe_load(f) or {}
+            # Deep copy: the cached object is shared and this one gets edited and saved
+            return copy.deepcopy(yaml_cache.load_yaml(self.config_path)) or {}
         except FileNotFoundError:
             raise FileNotFoundError(f"Config file {self.config_path} not found")
-        except yaml.YAMLError as e:
-            raise ValueError(f"Error parsing YAML file: {e}")
 
     def get_config(self) -> Dict[str, Any]:
         """Return the current configuration."""
         return self.config
 
     def update_config(self, new_config: Dict[str, Any]) -> None:
-        """Update the in-memory configuration and save to file."""
-        self.config = new_config
-        self._save_config()
+        """Update the in-memory configuration and schedule a save to file."""
+        with self._lock:
+            self.config = new_config
+            # Callers keep editing self.config in place; the timer thread only
+            # ever sees this copy, taken on the caller's thread
+            self._pending = copy.deepcopy(new_config)
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+            self._flush_timer = threading.Timer(self.save_delay, self._background_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Write pending configuration changes to the file now."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._pending is not None:
+                self._save_config(self._pending)
+                self._pending = None
+
+    def _background_flush(self) -> None:
+        try:
+            self.flush()
+        except IOError as e:
+            # Runs on the timer thread or at exit, where nobody can handle the error;
+            # the snapshot stays pending for the next flush
+            self.logger.error("%s", e)
+
+    def _save_config(self, config: Dict[str, Any]) -> None:
+        """Save a configuration snapshot to the YAML file."""
+        import yaml
 
-    def _save_config(self) -> None:
-        """Save the current configuration to the YAML file."""
+        # Write a sibling temp file and rename it over the config, so a crash
+        # mid-write never leaves a truncated configs.yaml behind
+        tmp_path = None
         try:
-            with self.config_path.open('w') as f:
-                print("SAVING CONFIGURATION TO FILE")
-                yaml.safe_dump(self.config, f, sort_keys=False)
+            with tempfile.NamedTemporaryFile('w', dir=self.config_path.parent,
+                                             prefix=self.config_path.name + '.',
+                                             suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+                yaml.dump(config, f, Dumper=dumper, sort_keys=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # The temp file is created 0600; keep the config's own permissions
+            with contextlib.suppress(FileNotFoundError):
+                os.chmod(tmp_path, stat.S_IMODE(self.config_path.stat().st_mode))
+            os.replace(tmp_path, self.config_path)
         except Exception as e:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_path)
             raise IOError(f"Error saving config to {self.config_path}: {e}")
+        # Saves a YAML re-parse on the next start
+        yaml_cache.prime(self.config_path, config)
 
     def update_ollama_models(self):
+        selected_client_name = None
         try:
             # Step 1: Find all Ollama clients (type: openai-compatible)
-            ollama_clients = [
-                client for client in self.config.get('clients', [])
-                if client.get('type') == 'ollama'
-            ]
-            if not ollama_clients:
-                raise ValueError("No Ollama clients (type: ollamollamaa) found in configuration")
+            ollama_clients = self._ollama_clients()
 
             # Step 2: If multiple Ollama clients, prompt user to select one
             if len(ollama_clients) > 1:
+                import questionary
+
                 choices = [client['name'] for client in ollama_clients]
                 print(choices)
                 selected_client_name = questionary.select(
@@ -74,40 +131,93 @@ class ConfigManager:
                 raise ValueError(f"Selected Ollama client {selected_client_name} not found")
 
             # Step 3: Get model names from Ollama server via HTTP API
-            api_base = ollama_client.get('api_base')
-            if not api_base:
-                raise ValueError(f"No api_base defined for Ollama client {selected_client_name}")
-            response = requests.get(f"{api_base}/api/tags")
-            response.raise_for_status()
-            data = response.json()
-            ollama_models = [model['name'] for model in data.get('models', []) if model.get('name')]
-            self.logger.debug("Existing Ollama models for %s: %s", selected_client_name, ollama_models)
-
-            # Step 4: Get current models from config for the selected client
-            config_models = {model['name'] for model in ollama_client.get('models', [])}
-            self.logger.debug("Ollama models in config for %s: %s", selected_client_name, config_models)
-
-            # Step 5: Add new models from Ollama to config
-            for model_name in ollama_models:
-                if model_name not in config_models:
-                    ollama_client['models'].append({
-                        'name': model_name,
-                        'max_input_tokens': 128000  # Default value from existing config
-                    })
-                    self.logger.debug("Added model %s to config for %s", model_name, selected_client_name)
-
-            # Step 6: Remove models from config that are not in Ollama
-            ollama_client['models'] = [
-                model for model in ollama_client['models']
-                if model['name'] in ollama_models
-            ]
-            self.logger.debug("Updated Ollama models in config for %s: %s", selected_client_name, [model['name'] for model in ollama_client['models']])
+            ollama_models = self._fetch_ollama_models(ollama_client)
+
+            # Steps 4-6: Reconcile the client's model list with the server
+            self._reconcile_ollama_models(ollama_client, ollama_models)
 
             # Step 7: Update the config file
             self.update_config(self.config)
-            self.logger.info("Updated %s with current Ollama models for %s: %s", self.config_path, selected_client_name, [model['name'] for model in ollama_client['models']])
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("Scheduled saving %s with current Ollama models for %s: %s", self.config_path, selected_client_name, [model['name'] for model in ollama_client['models']])
 
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"Error fetching models from Ollama API for {selected_client_name}: {e}")
+            self.logger.error("Error fetching models from Ollama API for %s: %s", selected_client_name, e)
         except Exception as e:
-            self.logger.error(f"Error updating configuration for {selected_client_name}: {e}")
+            self.logger.error("Error updating configuration for %s: %s", selected_client_name, e)
+
+    def update_all_ollama_models(self):
+        """Refresh the model lists of every Ollama client, querying the servers concurrently."""
+        try:
+            ollama_clients = self._ollama_clients()
+        except ValueError as e:
+            self.logger.error("%s", e)
+            return
+
+        # Only the HTTP calls run in the pool; the config is edited on this thread
+        with ThreadPoolExecutor(max_workers=min(8, len(ollama_clients))) as pool:
+            futures = [(client, pool.submit(self._fetch_ollama_models, client))
+                       for client in ollama_clients]
+            updated = []
+            for client, future in futures:
+                try:
+                    self._reconcile_ollama_models(client, future.result())
+                except requests.exceptions.RequestException as e:
+                    self.logger.error("Error fetching models from Ollama API for %s: %s", client['name'], e)
+                except Exception as e:
+                    self.logger.error("Error updating configuration for %s: %s", client['name'], e)
+                else:
+                    updated.append(client['name'])
+
+        if updated:
+            self.update_config(self.config)
+            self.logger.info("Scheduled saving %s with current Ollama models for %s", self.config_path, updated)
+
+    def _ollama_clients(self) -> List[Dict[str, Any]]:
+        ollama_clients = [
+            client for client in self.config.get('clients', [])
+            if client.get('type') == 'ollama'
+        ]
+        if not ollama_clients:
+            raise ValueError("No Ollama clients (type: ollama) found in configuration")
+        return ollama_clients
+
+    def _fetch_ollama_models(self, ollama_client: Dict[str, Any]) -> List[str]:
+        """Return the names of the models pulled on an Ollama client's server."""
+        api_base = ollama_client.get('api_base')
+        if not api_base:
+            raise ValueError(f"No api_base defined for Ollama client {ollama_client['name']}")
+        response = http_pool.SESSION.get(f"{api_base}/api/tags", timeout=http_pool.DEFAULT_TIMEOUT)
+        response.raise_for_status()
+        # The C decoder straight on the bytes, without requests' charset detection
+        data = loads(response.content)
+        ollama_models = [model['name'] for model in data.get('models', []) if model.get('name')]
+        self.logger.debug("Existing Ollama models for %s: %s", ollama_client['name'], ollama_models)
+        return ollama_models
+
+    def _reconcile_ollama_models(self, ollama_client: Dict[str, Any], ollama_models: List[str]) -> None:
+        """Make the client's configured models match the ones on its server."""
+        client_name = ollama_client['name']
+        models = ollama_client.setdefault('models', [])
+
+        # Step 4: Get current models from config for the selected client
+        config_models = {model['name'] for model in models}
+        self.logger.debug("Ollama models in config for %s: %s", client_name, config_models)
+
+        # Step 5: Add new models from Ollama to config
+        for model_name in ollama_models:
+            if model_name not in config_models:
+                models.append({
+                    'name': model_name,
+                    'max_input_tokens': 128000  # Default value from existing config
+                })
+                self.logger.debug("Added model %s to config for %s", model_name, client_name)
+
+        # Step 6: Remove models from config that are not in Ollama
+        served = set(ollama_models)
+        ollama_client['models'] = [
+            model for model in models
+            if model['name'] in served
+        ]
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Updated Ollama models in config for %s: %s", client_name, [model['name'] for model in ollama_client['models']])
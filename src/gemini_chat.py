@@ -1,27 +1,54 @@
 # gemini_chat.py
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 from .base_chat import BaseChatClient
 
+# Sent unchanged with every request, so build it once
+_SAFETY_SETTINGS = [
+    {'category': 'HARM_CATEGORY_HARASSMENT', 'threshold': 'BLOCK_NONE'},
+    {'category': 'HARM_CATEGORY_HATE_SPEECH', 'threshold': 'BLOCK_NONE'},
+    {'category': 'HARM_CATEGORY_SEXUALLY_EXPLICIT', 'threshold': 'BLOCK_NONE'},
+    {'category': 'HARM_CATEGORY_DANGEROUS_CONTENT', 'threshold': 'BLOCK_NONE'}
+]
+_GEMINI_ROLES = frozenset(('user', 'system'))
+
 class GeminiChat(BaseChatClient):
-    def send_message(self, messages: List[Dict[str, str]], temperature: float) -> str:
-        headers = {
+    # A chunk may carry several text parts; decode it fully
+    _stream_text_re = None
+
+    def __init__(self, config: Dict[str, Any], model_config: Dict[str, Any]):
+        super().__init__(config, model_config)
+        self._url = f"{self.api_base}/models/{self.model_name}:generateContent"
+        self._stream_url = f"{self.api_base}/models/{self.model_name}:streamGenerateContent?alt=sse"
+        self._headers = {
             'Content-Type': 'application/json',
             'x-goog-api-key': self.api_key
         }
+
+    def _build_request(self, messages: List[Dict[str, str]],
+                       temperature: float) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
         payload = {
             'contents': [
-                {'parts': [{'text': msg['content']}]}
-                for msg in messages if msg['role'] in ['user', 'system']
+                {'parts': ({'text': msg['content']},)}
+                for msg in messages if msg['role'] in _GEMINI_ROLES
             ],
             'generationConfig': {'temperature': temperature},
-            'safetySettings': [
-                {'category': 'HARM_CATEGORY_HARASSMENT', 'threshold': 'BLOCK_NONE'},
-                {'category': 'HARM_CATEGORY_HATE_SPEECH', 'threshold': 'BLOCK_NONE'},
-                {'category': 'HARM_CATEGORY_SEXUALLY_EXPLICIT', 'threshold': 'BLOCK_NONE'},
-                {'category': 'HARM_CATEGORY_DANGEROUS_CONTENT', 'threshold': 'BLOCK_NONE'}
-            ]
+            'safetySettings': _SAFETY_SETTINGS
         }
-        data = self._send_request(f"{self.api_base}/models/{self.model_name}:generateContent", headers, payload)
+        return self._url, self._headers, payload
+
+    def _build_stream_request(self, messages: List[Dict[str, str]],
+                              temperature: float) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        _, headers, payload = self._build_request(messages, temperature)
+        return self._stream_url, headers, payload
+
+    def _parse_stream_chunk(self, chunk: Dict[str, Any]) -> Optional[str]:
+        try:
+            parts = chunk['candidates'][0]['content']['parts']
+        except (KeyError, IndexError):
+            return None
+        return ''.join(part.get('text', '') for part in parts)
+
+    def _parse_response(self, data: Dict[str, Any]) -> str:
         try:
             return data['candidates'][0]['content']['parts'][0]['text']
         except (KeyError, IndexError) as parse_err:
@@ -0,0 +1,30 @@
+# http_pool.py
+"""Process-wide requests session, so every client reuses keep-alive connections per host."""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) seconds for short calls such as model listings
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# Only idempotent GETs are retried here: chat POSTs go through
+# BaseChatClient's own backoff and circuit breaker, and retrying connect
+# errors at this level too would multiply their attempts.
+_RETRY = Retry(
+    total=2,
+    connect=0,
+    backoff_factor=0.25,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(('GET',)),
+    raise_on_status=False,
+)
+
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=_RETRY)
+SESSION.mount('https://', _adapter)
+SESSION.mount('http://', _adapter)
+
+
+def close() -> None:
+    """Drop the pooled connections; the session reconnects if used again."""
+    SESSION.close()
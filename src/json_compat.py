@@ -0,0 +1,15 @@
+# json_compat.py
+"""JSON encode/decode helpers that use orjson when it is installed."""
+import json
+
+try:
+    import orjson
+
+    dumps = orjson.dumps
+    loads = orjson.loads
+except ImportError:
+    def dumps(obj) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes."""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    loads = json.loads
@@ -1,21 +1,30 @@
-from dataclasses import dataclass
-import yaml
+from dataclasses import dataclass, field
+from collections import deque
+import asyncio
+import importlib
+import importlib.util
 import re
-from typing import Optional, List, Dict, Literal
-from .xai_chat import XaiChat
-from .gemini_chat import GeminiChat
-from .base_chat import BaseChatClient
-from .openai_chat import OpenAiChat
-from .openai_compatible_chat import OpenAiCompatibleChat
+from typing import Optional, List, Dict, Literal, Union, Tuple, Any, Iterator, TYPE_CHECKING
 from .config_manager import ConfigManager
 from pathlib import Path
 import logging
 from .config_manager import ConfigManager
 import os
+from . import http_pool
+from .yaml_cache import load_yaml
+from .json_compat import loads
+
+if TYPE_CHECKING:
+    from .base_chat import BaseChatClient
 
 RoleKind = Literal['system', 'embedded', 'fewshot']
 
-@dataclass
+_FEWSHOT_RE = re.compile(r'###\s*INPUT:.*###\s*OUTPUT:', re.S)
+_SCAFFOLD_RE = re.compile(r'###\s*INPUT:|###\s*OUTPUT:', re.I)
+_SCAFFOLD_EXTRACT_RE = re.compile(r'###\s*INPUT:\n(.*)\n###\s*OUTPUT:', re.S)
+_PLACEHOLDER_RE = re.compile(r'\{__INPUT__\}|__INPUT__')
+
+@dataclass(slots=True)
 class RoleConfig:
     name: str
     template: str = ""                  # raw role body
@@ -24,15 +33,35 @@ class RoleConfig:
     temperature: Optional[float] = None
     top_p: Optional[float] = None
     description: Optional[str] = None   # Added for role description
+    # template split around its input placeholders, so filling it is one join
+    _parts: Tuple[str, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._parts = tuple(_PLACEHOLDER_RE.split(self.template))
+
+    def fill(self, user_input: str) -> str:
+        """Return the template with every input placeholder replaced by user_input."""
+        return user_input.join(self._parts)
 
     def detect_role_kind(self, template: str) -> RoleKind:
-        if re.search(r'###\s*INPUT:.*###\s*OUTPUT:', template, re.S):
+        if _FEWSHOT_RE.search(template):
             return 'fewshot'
         if '__INPUT__' in template or '{__INPUT__}' in template:
             return 'embedded'
         return 'system'
 
 class LLMClient:
+    # provider type -> (client module, client class, extra constructor kwargs);
+    # modules are imported on first use so only the providers in use are loaded
+    _PROVIDERS: Dict[str, Tuple[str, str, Dict[str, Any]]] = {
+        'openai': ('openai_compatible_chat', 'OpenAiCompatibleChat', {'require_auth': True, 'path': '/chat/completions'}),
+        'grok': ('openai_compatible_chat', 'OpenAiCompatibleChat', {'require_auth': True, 'path': '/chat/completions'}),
+        'gemini': ('gemini_chat', 'GeminiChat', {}),
+        'ollama': ('openai_compatible_chat', 'OpenAiCompatibleChat', {}),
+    }
+    # Messages (user + assistant) kept as context; older turns fall out of the window
+    max_history = 40
+
     def __init__(self, config_manager: ConfigManager, roles_path: str = None):
         try:
             self.logger = logging.getLogger("llmchat.llmclient")
@@ -41,20 +70,26 @@ class LLMClient:
         self.config_manager = config_manager 
         self.config = config_manager.get_config()
         self.clients = {client['type']: client for client in self.config.get('clients', [])}
+        self._clients_by_name = {client.get('name'): client for client in self.config.get('clients', [])}
+        self._resolved_api_keys = self._resolve_api_keys()
+        self._models_cache: Optional[Tuple[str, ...]] = None
+        self._models_by_provider: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
         self.default_model = self.config.get('default', None)
-        self.current_client: Optional[BaseChatClient] = None
+        self.current_client: Optional['BaseChatClient'] = None
+        self._client_cache: Dict[str, 'BaseChatClient'] = {}
         self.current_model: Optional[str] = None
         self.active_role: Optional[RoleConfig] = None
         self.roles = self._load_roles(roles_path) if roles_path else {}
         self.load_model() # loads the default model
-        self.history = []
+        self.history = deque(maxlen=self.max_history)
+        # history with role scaffolding stripped, kept in step by append_turn
+        self._neutral_history = deque(maxlen=self.max_history)
 
     def _load_roles(self, roles_path: str) -> Dict[str, RoleConfig]:
         """Load roles from a YAML file."""
         try:
             roles_path = Path(roles_path)
-            with roles_path.open('r') as f:
-                roles_data = yaml.safe_load(f) or {'roles': []}
+            roles_data = load_yaml(roles_path) or {'roles': []}
             return {
                 role['name']: RoleConfig(
                     name=role['name'],
@@ -67,12 +102,22 @@ class LLMClient:
                 ) for role in roles_data.get('roles', [])
             }
         except FileNotFoundError:
-            self.logger.warning(f"Roles file {roles_path} not found")
+            self.logger.warning("Roles file %s not found", roles_path)
             return {}
-        except yaml.YAMLError as e:
-            self.logger.error(f"Error parsing roles YAML file: {e}")
+        except ValueError as e:
+            self.logger.error("Error parsing roles YAML file: %s", e)
             return {}
 
+    def _resolve_api_keys(self) -> Dict[str, str]:
+        """Resolve '$ENVVAR' api keys once, keyed by client name, leaving the config untouched."""
+        resolved = {}
+        for client in self.config.get('clients', []):
+            api_key = client.get('api_key') or ''
+            if api_key.startswith('$'):
+                api_key = os.getenv(api_key[1:], api_key)
+            resolved[client.get('name')] = api_key
+        return resolved
+
     def set_role(self, role: RoleConfig):
         role.kind = role.kind or role.detect_role_kind(role.template)
         self.active_role = role
@@ -90,97 +135,139 @@ class LLMClient:
         if not model:
             raise ValueError("No model specified and default model not present")
 
-        client_name, model_name, *version = model.split(':') if ':' in model else (None, model)
-        if version:
-            model_name += ":" + version[0]
+        self.current_client = self._get_client(model)
+        self.current_model = model
+
+    def close(self) -> None:
+        """Close every chat client built so far and the shared connection pool."""
+        for client in self._client_cache.values():
+            client.close()
+        self._client_cache.clear()
+        http_pool.close()
+
+    def _get_client(self, model: str) -> 'BaseChatClient':
+        """Return the chat client for a model, building it on first use.
+
+        Clients stay open so switching back to a model reuses its pooled connections.
+        """
+        client = self._client_cache.get(model)
+        if client is None:
+            client = self._client_cache[model] = self._create_client(model)
+        return client
+
+    def _create_client(self, model: str) -> 'BaseChatClient':
+        """Build a chat client for a 'client_name:model' identifier."""
+        # The model part keeps any ':tag' suffix, e.g. 'Ollama:llama3.2:latest'
+        client_name, sep, model_name = model.partition(':')
+        if not sep:
+            client_name, model_name = None, model
         self.logger.debug("load_model -> client_name: %s, model_name: %s", client_name, model_name)
 
         if not client_name or not model_name:
             raise ValueError(f"Invalid format: {model}. Expecting 'client_name:model'")
         
-        client_config = next(
-            (client for client in self.clients.values() if client.get('name') == client_name),
-            None
-        )
+        client_config = self._clients_by_name.get(client_name)
         if not client_config:
             raise ValueError(f"Client {client_name} not found in config file")
 
-        if client_config["api_key"].startswith('$'):
-            envvar = client_config["api_key"][1:]
-            client_config["api_key"] = os.getenv(envvar, client_config["api_key"])
-        model_config = next(
-            (m for m in client_config.get('models', []) if m['name'] == model_name),
-            None
-        )
-        self.logger.debug("client config loaded: %s", client_config)
-        self.logger.debug("model config loaded: %s", model_config)
+        # Shallow copy so the resolved secret never lands in the saved config
+        client_config = {**client_config, 'api_key': self._resolved_api_keys.get(client_name, '')}
+        model_config = self._model_index().get(client_name, {}).get(model_name)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            # Skip rendering the config dicts unless they will be shown
+            self.logger.debug("client config loaded: %s", client_config)
+            self.logger.debug("model config loaded: %s", model_config)
         if not model_config:
             raise ValueError(f"Model {model_name} for client {client_name} not found")
 
         provider_type = client_config.get('type')
-        if provider_type == 'grok':
-            self.current_client = XaiChat(client_config, model_config)
-        elif provider_type == 'gemini':
-            self.current_client = GeminiChat(client_config, model_config)
-        elif provider_type == 'openai':
-            self.current_client = OpenAiChat(client_config, model_config)
-        elif provider_type == 'ollama':
-            self.current_client = OpenAiCompatibleChat(client_config, model_config)
-        else:
+        provider = self._PROVIDERS.get(provider_type)
+        if provider is None:
             raise ValueError(f"Provider type {provider_type} not supported")
-
-        self.current_model = model
+        module_name, class_name, client_kwargs = provider
+        client_cls = getattr(importlib.import_module(f'.{module_name}', __package__), class_name)
+        return client_cls(client_config, model_config, **client_kwargs)
 
     def send_message(self, messages: List[Dict[str, str]], temperature: float = 1.0, top_p=None) -> str:
         if self.current_client is None:
             raise ValueError("No model loaded.")
         return self.current_client.send_message(messages, temperature)
 
-    def list_models(self):
-        models = []
-        for provider in self.config["clients"]:
-            provider_name = provider.get("name")
-            for model in provider["models"]:
-                models.append(provider["name"] + ":" + model['name'] )
-        return models
+    def list_models(self) -> Tuple[str, ...]:
+        if self._models_cache is None:
+            self._models_cache = tuple(
+                f"{provider['name']}:{model['name']}"
+                for provider in self.config["clients"]
+                for model in provider["models"]
+            )
+        return self._models_cache
+
+    def _model_index(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Map each client name to its model configs by model name."""
+        if self._models_by_provider is None:
+            self._models_by_provider = {
+                client.get('name'): {m['name']: m for m in client.get('models', [])}
+                for client in self.config.get('clients', [])
+            }
+        return self._models_by_provider
+
+    def invalidate_models(self) -> None:
+        """Drop cached model data after the config's model lists change."""
+        self._models_cache = None
+        self._models_by_provider = None
+        # Clients of models that are no longer configured must not be loadable from the cache
+        index = self._model_index()
+        for model in list(self._client_cache):
+            client_name, _, model_name = model.partition(':')
+            if model_name not in index.get(client_name, {}):
+                self._client_cache.pop(model).close()
 
     def get_config(self):
         return self.config
 
-    def fill_embedded(self, template: str, user_input: str) -> str:
-        return (template
-                .replace('{__INPUT__}', user_input)
-                .replace('__INPUT__', user_input))
 
+    def _neutralize(self, m: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """Return the message as it should be replayed as context, or None to drop it."""
+        if m.get('role') == 'system':
+            return None
+        if m.get('role') == 'user' and _SCAFFOLD_RE.search(m.get('content', '')):
+            content = m.get('content', '')
+            match = _SCAFFOLD_EXTRACT_RE.search(content)
+            if match:
+                return {'role': 'user', 'content': match.group(1).strip()}
+            return None
+        return m
 
-    def neutralize_history(self) -> List[Dict[str, str]]:
-        SCAFFOLD_MARK = re.compile(r'###\s*INPUT:|###\s*OUTPUT:', re.I)
-        clean = []
-        for m in self.history:
-            if m.get('role') == 'system':
-                continue
-            if m.get('role') == 'user' and SCAFFOLD_MARK.search(m.get('content', '')):
-                content = m.get('content', '')
-                match = re.search(r'###\s*INPUT:\n(.*)\n###\s*OUTPUT:', content, re.S)
-                if match:
-                    clean.append({'role': 'user', 'content': match.group(1).strip()})
-                continue
-            clean.append(m)
-        return clean
+
+    def append_turn(self, user_input: str, response: str) -> None:
+        """Record a completed turn in both the raw and the neutralized history."""
+        for m in ({'role': 'user', 'content': user_input},
+                  {'role': 'assistant', 'content': response}):
+            self.history.append(m)
+            clean = self._neutralize(m)
+            if clean is not None:
+                self._neutral_history.append(clean)
+
+
+    def neutralize_history(self) -> deque:
+        return self._neutral_history
 
 
     def build_messages_for_role(self, 
                                user_input: str,
-                               role: Optional[RoleConfig] = None) -> List[Dict[str, str]]:
-        hist = self.neutralize_history()  # Always neutralize for consistency
+                               role: Optional[RoleConfig] = None,
+                               history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+        hist = self.neutralize_history() if history is None else history  # Always neutralize for consistency
         if role is None:
-            return hist + [{'role': 'user', 'content': user_input}]  
+            return [*hist, {'role': 'user', 'content': user_input}]
         
-        kind = role.kind or role.detect_role_kind(role.template)
+        if role.kind is None:
+            role.kind = role.detect_role_kind(role.template)
+        kind = role.kind
         if kind == 'system':
-            return [{'role': 'system', 'content': role.template}] + hist + [{'role': 'user', 'content': user_input}]
+            return [{'role': 'system', 'content': role.template}, *hist, {'role': 'user', 'content': user_input}]
         else:  # embedded or fewshot
-            return hist + [{'role': 'user', 'content': self.fill_embedded(role.template, user_input)}]
+            return [*hist, {'role': 'user', 'content': role.fill(user_input)}]
 
 
     def send_with_role(self,
@@ -193,20 +280,140 @@ class LLMClient:
         role = self.active_role
         messages = self.build_messages_for_role(user_input, role=role)  # Temp messages, don't set self.history
         
-        eff_temperature = (role.temperature if role and role.temperature is not None
-                           else temperature if temperature is not None
-                           else 1.0)
+        eff_temperature = self._effective_temperature(temperature)
         eff_top_p = (role.top_p if role and role.top_p is not None
                      else top_p)
  
         response = self.current_client.send_message(messages, temperature=eff_temperature)
         
-        self.history.append({'role': 'user', 'content': user_input}) 
-        self.history.append({'role': 'assistant', 'content': response})
+        self.append_turn(user_input, response)
         
         return response
 
 
+    def send_with_role_stream(self,
+                              user_input: str,
+                              temperature: Optional[float] = None) -> Iterator[str]:
+        """Like send_with_role, but yields the reply as it streams in.
+
+        The turn is added to the history once the stream completes.
+        """
+        if self.current_client is None:
+            raise ValueError("No model loaded.")
+
+        messages = self.build_messages_for_role(user_input, role=self.active_role)
+        chunks = []
+        for chunk in self.current_client.send_message_stream(messages, self._effective_temperature(temperature)):
+            chunks.append(chunk)
+            yield chunk
+
+        self.append_turn(user_input, ''.join(chunks))
+
+
+    def send_batch(self,
+                   inputs: List[str],
+                   temperature: Optional[float] = None) -> List[str]:
+        """Answer several independent prompts with a single request.
+
+        The prompts are numbered in one user message and the model is asked for
+        a JSON array of answers in the same order. The active role is applied
+        once, the conversation history is not sent and not updated.
+        """
+        if self.current_client is None:
+            raise ValueError("No model loaded.")
+
+        numbered = '\n'.join(f"{i}) {text}" for i, text in enumerate(inputs, 1))
+        prompt = (f"Process each numbered item below independently. Reply with only a JSON array "
+                  f"of {len(inputs)} strings, the answer to each item in order.\n{numbered}")
+        messages = self.build_messages_for_role(prompt, role=self.active_role, history=[])
+        response = self.current_client.send_message(messages, self._effective_temperature(temperature))
+
+        # Models often wrap the array in a ```json fence or a sentence
+        start, end = response.find('['), response.rfind(']')
+        try:
+            answers = loads(response[start:end + 1]) if start != -1 else None
+        except ValueError:
+            answers = None
+        if not isinstance(answers, list) or len(answers) != len(inputs):
+            raise RuntimeError(f"Model did not return a JSON array of {len(inputs)} answers")
+        return [a if isinstance(a, str) else str(a) for a in answers]
+
+
+    def _effective_temperature(self, temperature: Optional[float] = None) -> float:
+        role = self.active_role
+        return (role.temperature if role and role.temperature is not None
+                else temperature if temperature is not None
+                else 1.0)
+
+
+    def send_to_models(self,
+                       user_input: str,
+                       models: List[str],
+                       temperature: Optional[float] = None) -> List[Union[str, Exception]]:
+        """Send the same prompt to several models concurrently.
+
+        Results come back in the order of `models`; a failing model yields its
+        exception instead of aborting the others. History is left untouched.
+        """
+        messages = self.build_messages_for_role(user_input, role=self.active_role)
+        results: List[Union[str, Exception]] = []
+        jobs, job_slots = [], []
+        for model in models:
+            # An unknown or malformed id fails only its own slot
+            try:
+                client = self._get_client(model)
+            except ValueError as e:
+                results.append(e)
+                continue
+            job_slots.append(len(results))
+            results.append(None)
+            jobs.append((client, messages))
+        if jobs:
+            replies = asyncio.run(self._gather(jobs, self._effective_temperature(temperature)))
+            for slot, reply in zip(job_slots, replies):
+                results[slot] = reply
+        return results
+
+
+    def send_many(self,
+                  messages_list: List[List[Dict[str, str]]],
+                  temperature: Optional[float] = None,
+                  max_concurrency: int = 8) -> List[Union[str, Exception]]:
+        """Send independent conversations to the current model concurrently.
+
+        At most `max_concurrency` requests are in flight at once. Results and
+        failures come back in input order, as with send_to_models.
+        """
+        if self.current_client is None:
+            raise ValueError("No model loaded.")
+        jobs = [(self.current_client, messages) for messages in messages_list]
+        return asyncio.run(self._gather(jobs, self._effective_temperature(temperature), max_concurrency))
+
+
+    async def _gather(self,
+                      jobs: List[Tuple['BaseChatClient', List[Dict[str, str]]]],
+                      temperature: float,
+                      max_concurrency: Optional[int] = None) -> List[Union[str, Exception]]:
+        import httpx
+
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def run(client, messages):
+            if semaphore is None:
+                return await client.send_message_async(messages, temperature, http_client)
+            async with semaphore:
+                return await client.send_message_async(messages, temperature, http_client)
+
+        # One HTTP/2 connection per host carries all in-flight requests to it
+        http2 = importlib.util.find_spec('h2') is not None
+        limits = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+        async with httpx.AsyncClient(http2=http2, limits=limits, timeout=httpx.Timeout(300.0, connect=3.05)) as http_client:
+            return await asyncio.gather(
+                *(run(client, messages) for client, messages in jobs),
+                return_exceptions=True
+            )
+
+
     def get_current_model(self):
         return self.current_model
 
@@ -1,17 +1,27 @@
 # openai_compatible_chat.py
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 from .base_chat import BaseChatClient
 
 class OpenAiCompatibleChat(BaseChatClient):
-    def send_message(self, messages: List[Dict[str, str]], temperature: float) -> str:
-        headers = {"Content-Type": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+    """Client for any endpoint speaking the OpenAI chat completions API (OpenAI, xAI, Ollama...)."""
 
+    def __init__(self, config: Dict[str, Any], model_config: Dict[str, Any],
+                 require_auth: bool = False,
+                 path: str = "/v1/chat/completions",
+                 extra_headers: Optional[Dict[str, str]] = None):
+        super().__init__(config, model_config)
+        self._url = f"{self.api_base}{path}"
+        self._headers = {"Content-Type": "application/json"}
+        if require_auth or self.api_key:
+            self._headers["Authorization"] = f"Bearer {self.api_key}"
+        if extra_headers:
+            self._headers.update(extra_headers)
+
+    def _build_request(self, messages: List[Dict[str, str]],
+                       temperature: float) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
         payload = {
             "model": self.model_name,
             "messages": messages,
             "temperature": temperature,
         }
-        data = self._send_request(f"{self.api_base}/v1/chat/completions", headers, payload)
-        return self._parse_response(data)
+        return self._url, self._headers, payload
@@ -0,0 +1,95 @@
+# yaml_cache.py
+"""YAML loading memoized by (path, mtime, size), in-process and in a JSON sidecar on disk."""
+import contextlib
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, List
+
+from .json_compat import dumps, loads
+
+CACHE_DIR = Path.home() / ".cache" / "llm-chat-cli"
+
+logger = logging.getLogger("llmchat.yaml_cache")
+
+
+def load_yaml(path) -> Any:
+    """Parse a YAML file, reusing the previous result while the file is unchanged.
+
+    Raises FileNotFoundError if the file is missing and ValueError if it is not valid YAML.
+    The returned object is shared between callers and must not be mutated.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    return _parse_yaml(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def prime(path, data: Any) -> None:
+    """Record data as the parsed content of a YAML file that was just written.
+
+    The next load_yaml() of the file, in this or a later process, then skips the YAML parser.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    _write_cache(_cache_file(str(path)), [stat.st_mtime_ns, stat.st_size], data)
+
+
+def _cache_file(path: str) -> Path:
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]
+    return CACHE_DIR / f"{Path(path).stem}-{digest}.cache.json"
+
+
+@functools.lru_cache(maxsize=32)
+def _parse_yaml(path: str, mtime_ns: int, size: int) -> Any:
+    stamp: List[int] = [mtime_ns, size]
+    cache_file = _cache_file(path)
+    try:
+        cached = loads(cache_file.read_bytes())
+        if cached['stamp'] == stamp:
+            return cached['data']
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.debug("Ignoring unreadable YAML cache %s: %s", cache_file, e)
+
+    # Only cache misses pay for importing yaml
+    import yaml
+
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    try:
+        with open(path, 'r') as f:
+            data = yaml.load(f, Loader=loader)
+    except yaml.YAMLError as e:
+        raise ValueError(f"Error parsing YAML file {path}: {e}") from e
+
+    _write_cache(cache_file, stamp, data)
+    return data
+
+
+def _write_cache(cache_file: Path, stamp: List[int], data: Any) -> None:
+    try:
+        encoded = dumps({'stamp': stamp, 'data': data})
+        # The stdlib encoder silently turns int keys into strings and orjson
+        # writes dates as text: only cache data that reads back unchanged
+        if loads(encoded)['data'] != data:
+            logger.debug("Not caching %s: its data does not round-trip through JSON", cache_file)
+            return
+        # The sidecar copies the config verbatim, api keys included: keep it owner-only
+        CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        os.chmod(CACHE_DIR, 0o700)
+        # mkstemp creates the file 0600; the rename also replaces older, wider-open sidecars
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=cache_file.name + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(encoded)
+            os.replace(tmp_path, cache_file)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+    except (OSError, TypeError) as e:
+        # TypeError: the YAML held values JSON cannot represent at all
+        logger.debug("Could not write YAML cache %s: %s", cache_file, e)